@@ -3,107 +3,450 @@
 # [FIX] Corrected a critical typo in the add_message_to_conversation method call.
 
 import os
+import asyncio
+import importlib.util
+import atexit
 import logging
 import pickle
-import json
+import platform
+import queue
+import re
+import textwrap
 import uuid
-from collections import defaultdict
-from typing import List, Dict, Generator
+import hashlib
+import hmac
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import accumulate
+from typing import List, Dict, AsyncGenerator, AsyncIterator
 
 import numpy as np
+import torch
 from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-import requests
+import httpx
+import orjson
+
+try:
+    import faiss
+except ImportError:  # Optional: knowledge search falls back to a numpy scan.
+    faiss = None
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows, where only a single worker is supported anyway.
+    fcntl = None
 
 import tools # Make sure tools.py is available
-from team_manager import AEONOVX_TEAM # Import team data for authentication
+from team_manager import find_team_member # Team database lookup for authentication
 
 # --- Configuration ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+EMBEDDINGS_MODEL_NAME = 'all-MiniLM-L6-v2'
+# PyTorch backends use fused scaled-dot-product attention kernels instead of the eager attention path.
+TORCH_MODEL_KWARGS = {"attn_implementation": "sdpa"}
+# Under uvicorn --workers each process has its own memory, so per-process caches must not be trusted as the source of truth.
+MULTI_WORKER = int(os.getenv("WORKERS", "1")) > 1
+HNSW_MIN_VECTORS = 10000  # Corpora at least this large are searched through an HNSW graph instead of a flat scan.
+# Whole messages that never need documentation: pleasantries, and time/date questions answered by the tool.
+SMALL_TALK_PATTERN = re.compile(
+    r"(hi|hello|hey|thanks|thank you|thx|ok|okay|cool|great|bye|goodbye|good (morning|afternoon|evening|night)"
+    r"|what time is it|what('s| is) the (current )?(time|date)( now| today)?|what day is it( today)?)"
+    r"( ibot| there)?[\s!.?,]*",
+    re.IGNORECASE)
+
+# Each encode, a single query or a coalesced batch, is one small forward pass with no independent ops to overlap, so a
+# second inter-op pool would only add thread wake-ups. This covers the PyTorch path; ONNX Runtime is configured separately.
+# This must be set before torch runs any parallel work, hence at import.
+torch.set_num_interop_threads(1)
+
+def _default_onnx_file() -> str:
+    """The quantized MiniLM export built for this CPU; the AVX-512 ones fail or crawl on hosts that lack those units."""
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "onnx/model_qint8_arm64.onnx"
+    flags = set()
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith("flags"):
+                    flags = set(line.split(":", 1)[1].split())
+                    break
+    except OSError:
+        pass
+    if "avx512_vnni" in flags:
+        return "onnx/model_qint8_avx512_vnni.onnx"
+    if "avx512f" in flags:
+        return "onnx/model_qint8_avx512.onnx"
+    return "onnx/model_quint8_avx2.onnx"
+
+@lru_cache(maxsize=256)
+def _password_digest(password: str) -> bytes:
+    """SHA-256 of a stored team password, computed once per distinct password rather than on every login."""
+    return hashlib.sha256(password.encode('utf-8')).digest()
+
 # --- Groq API Client ---
+async def _aiter_sse_data(blocks: AsyncIterator[bytes]) -> AsyncGenerator[bytes, None]:
+    """Yields the payload of each SSE `data:` line, splitting the raw byte stream without per-line decoding."""
+    buffer = b""
+    async for block in blocks:
+        buffer += block
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.startswith(b"data: "):
+                yield line[6:].rstrip(b"\r")
+    if buffer.startswith(b"data: "):
+        yield buffer[6:].rstrip(b"\r")
+
 class GroqClient:
     def __init__(self, api_key: str):
         if not api_key: raise ValueError("Groq API key is required.")
         self.api_key = api_key
         self.api_url = "https://api.groq.com/openai/v1/chat/completions"
         self.model = "llama3-70b-8192"
-
-    def generate_response_stream(self, conversation_history: List[Dict], tools_config: List[Dict]) -> Generator[Dict, None, None]:
-        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
-        payload = {
-            "messages": conversation_history,
-            "model": self.model,
-            "stream": True,
-            "tools": tools_config,
-            "tool_choice": "auto"
-        }
+        # One HTTP/2 connection is multiplexed across turns and concurrent users, skipping repeat TLS handshakes.
+        # The transport also retries failed connection attempts, so a dropped keep-alive socket does not fail the turn.
+        self.client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(http2=True, retries=2, limits=httpx.Limits(max_keepalive_connections=8)),
+            timeout=60.0,
+            headers={"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"},
+        )
+        self._payload_head = b'{"model":' + orjson.dumps(self.model) + b',"stream":true,"tool_choice":"auto","tools":'
+
+    async def generate_response_stream(self, conversation_history: List[bytes], tools_json: bytes) -> AsyncGenerator[Dict, None]:
+        """Streams a completion; conversation_history holds each message, and tools_json the tools list, already serialized as JSON."""
+        # Messages are spliced in as stored bytes instead of re-serializing the whole history every turn.
+        payload = b"".join((self._payload_head, tools_json, b',"messages":[', b",".join(conversation_history), b"]}"))
 
         try:
-            response = requests.post(self.api_url, headers=headers, json=payload, timeout=60, stream=True)
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
+            async with self.client.stream("POST", self.api_url, content=payload) as response:
+                response.raise_for_status()
+                async for data_bytes in _aiter_sse_data(response.aiter_bytes()):
+                    if not data_bytes or data_bytes == b'[DONE]': continue
+
+                    try:
+                        data = orjson.loads(data_bytes)
+                        delta = data["choices"][0]["delta"]
+                        if delta.get("content"):
+                            yield {"type": "chunk", "content": delta["content"]}
+                        for call in delta.get("tool_calls") or ():
+                            yield {"type": "tool_call", "call": call}
+                    except (orjson.JSONDecodeError, KeyError, IndexError, AttributeError) as e:
+                        logger.warning(f"Could not parse a Groq stream chunk: {data_bytes!r}. Error: {e}")
+                        continue
+        except httpx.HTTPError as e:
             logger.error(f"API request to Groq failed: {e}")
             yield {"type": "error", "content": f"Connection to AI model failed. Error: {e}"}
-            return
-
-        for chunk in response.iter_lines():
-            if not chunk: continue
-            chunk_str = chunk.decode('utf-8').strip()
-            if chunk_str.startswith('data: '):
-                chunk_str = chunk_str[6:]
-
-            if chunk_str == '[DONE]': continue
-
-            try:
-                data = json.loads(chunk_str)
-                delta = data["choices"][0]["delta"]
-                if delta.get("content"):
-                    yield {"type": "chunk", "content": delta["content"]}
-                if delta.get("tool_calls"):
-                    yield {"type": "tool_call", "call": delta["tool_calls"][0]}
-            except (json.JSONDecodeError, KeyError, IndexError, AttributeError) as e:
-                logger.warning(f"Could not parse a Groq stream chunk: {chunk_str}. Error: {e}")
-                continue
 
 class ConversationMemory:
-    def __init__(self):
-        self.user_conversations = defaultdict(list)
-        self._load_memory()
-    def _load_memory(self):
+    """Conversation store backed by SQLite; each message is a single appended row instead of a full rewrite."""
+    def __init__(self, db_path: str = './data/memory.db'):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS conversations (
+                id TEXT PRIMARY KEY,
+                username TEXT NOT NULL,
+                title TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_conversations_username ON conversations (username);
+            CREATE TABLE IF NOT EXISTS messages (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                convo_id TEXT NOT NULL,
+                message BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_convo ON messages (convo_id, seq);
+        """)
+        self._migrate_pickle('./data/memory.pkl')
+        # Recently active conversations, as serialized messages, kept in step with every write so turns skip SQLite.
+        self._history_cache = OrderedDict()
+        # Another worker's writes would never reach this process's copy, so with several workers every read goes to SQLite.
+        self._history_cache_size = 0 if MULTI_WORKER else 256
+        self._history_cache_lock = threading.Lock()
+        # Keys being read from SQLite on a miss -> [readers, writes seen]; a read that overlapped a write isn't cached.
+        self._history_fills = {}
+        # Writes are queued and committed by a background thread so the chat stream never waits on disk.
+        self._write_queue = queue.Queue()
+        threading.Thread(target=self._writer_loop, name="memory-writer", daemon=True).start()
+        atexit.register(self.flush)
+    def _writer_loop(self):
+        while True:
+            batch = [self._write_queue.get()]
+            # Everything queued while the previous commit ran is coalesced into one transaction.
+            while True:
+                try:
+                    batch.append(self._write_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._commit(batch)
+            except Exception as e:
+                # One bad write must not take the rest of the batch, often other users' messages, down with it.
+                logger.error(f"Failed to save memory batch, retrying its writes one at a time: {e}", exc_info=True)
+                for item in batch:
+                    try:
+                        self._commit([item])
+                    except Exception as e:
+                        logger.error(f"Failed to save memory: {e}", exc_info=True)
+                        # The cache already shows this write; dropping the entry sends the next read to SQLite.
+                        with self._history_cache_lock:
+                            self._history_cache.pop(item[2], None)
+            finally:
+                for _ in batch:
+                    self._write_queue.task_done()
+    def _commit(self, batch: List[tuple]):
+        """Runs the queued (sql, params, cache key) writes in one transaction, rolling it back on failure."""
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN")
+                for sql, params, _ in batch:
+                    self._conn.execute(sql, params)
+                self._conn.execute("COMMIT")
+            except Exception:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                raise
+    def flush(self):
+        """Blocks until every queued write has been committed."""
+        self._write_queue.join()
+    def _migrate_pickle(self, pickle_path: str):
+        """One-time import of the legacy memory.pkl into SQLite."""
+        # Claiming the file with an atomic rename means only one of several starting workers ever imports it.
+        claimed_path = f"{pickle_path}.{os.getpid()}.migrating"
         try:
-            if os.path.exists('./data/memory.pkl'):
-                with open('./data/memory.pkl', 'rb') as f:
-                    self.user_conversations = pickle.load(f).get('conversations', self.user_conversations)
-        except Exception as e:
-            logger.error(f"Failed to load memory: {e}")
-    def save_memory(self):
+            os.replace(pickle_path, claimed_path)
+        except FileNotFoundError:
+            return
         try:
-            os.makedirs('./data', exist_ok=True)
-            with open('./data/memory.pkl', 'wb') as f:
-                pickle.dump({'conversations': self.user_conversations}, f)
+            with open(claimed_path, 'rb') as f:
+                user_conversations = pickle.load(f).get('conversations', {})
+            with self._lock:
+                self._conn.execute("BEGIN")
+                for username, convos in user_conversations.items():
+                    # The pickle kept newest-first; insert oldest-first so rowid order matches.
+                    for convo in reversed(convos):
+                        self._conn.execute("INSERT OR IGNORE INTO conversations (id, username, title) VALUES (?, ?, ?)",
+                                           (convo["id"], username, convo["title"]))
+                        self._conn.executemany("INSERT INTO messages (convo_id, message) VALUES (?, ?)",
+                                               [(convo["id"], orjson.dumps(m)) for m in convo["history"]])
+                self._conn.execute("COMMIT")
+            os.replace(claimed_path, pickle_path + '.migrated')
+            logger.info(f"Migrated {pickle_path} into SQLite memory store.")
         except Exception as e:
-            logger.error(f"Failed to save memory: {e}", exc_info=True)
+            logger.error(f"Failed to migrate memory: {e}", exc_info=True)
+            # Left open, the transaction would make the writer thread's first BEGIN fail and drop that batch.
+            with self._lock:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+            # Put the pickle back so the next start can retry the import.
+            os.replace(claimed_path, pickle_path)
     def start_new_conversation(self, username: str, first_message: str) -> str:
         convo_id = str(uuid.uuid4())
-        new_convo = {"id": convo_id, "title": first_message[:45] + "...", "history": []}
-        self.user_conversations[username].insert(0, new_convo)
-        self.save_memory()
+        with self._history_cache_lock:
+            self._write_queue.put(("INSERT INTO conversations (id, username, title) VALUES (?, ?, ?)",
+                                   (convo_id, username, first_message[:45] + "..."), (username, convo_id)))
+            self._cache_history((username, convo_id), [])
         return convo_id
-    def add_message_to_conversation(self, username: str, convo_id: str, message: Dict):
-        for convo in self.user_conversations[username]:
-            if convo["id"] == convo_id:
-                convo["history"].append(message)
-                break
-        self.save_memory()
+    def add_message_to_conversation(self, username: str, convo_id: str, message: Dict) -> bytes:
+        """Queues the message for storage and returns its serialized JSON."""
+        serialized = orjson.dumps(message)
+        with self._history_cache_lock:
+            self._write_queue.put((
+                "INSERT INTO messages (convo_id, message) "
+                "SELECT ?, ? WHERE EXISTS (SELECT 1 FROM conversations WHERE id = ? AND username = ?)",
+                (convo_id, serialized, convo_id, username), (username, convo_id)))
+            # Only conversations known to belong to this user are cached, mirroring the INSERT's ownership check.
+            cached = self._history_cache.get((username, convo_id))
+            if cached is not None:
+                cached.append(serialized)
+            fill = self._history_fills.get((username, convo_id))
+            if fill is not None:
+                fill[1] += 1
+        return serialized
     def get_conversation_history(self, username: str, convo_id: str) -> List[Dict]:
-        for convo in self.user_conversations[username]:
-            if convo["id"] == convo_id:
-                return convo["history"]
-        return []
+        return [orjson.loads(message) for message in self.get_serialized_history(username, convo_id)]
+    def get_serialized_history(self, username: str, convo_id: str) -> List[bytes]:
+        """The conversation's messages as stored JSON bytes, ready to splice into an API payload."""
+        key = (username, convo_id)
+        with self._history_cache_lock:
+            cached = self._history_cache.get(key)
+            if cached is not None:
+                self._history_cache.move_to_end(key)
+                return list(cached)
+            fill = self._history_fills.setdefault(key, [0, 0])
+            fill[0] += 1
+            writes_before = fill[1]
+        # The flush and SELECT run without the cache lock so writers on the event loop never wait on disk.
+        history = []
+        try:
+            self.flush()
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT m.message FROM messages m JOIN conversations c ON c.id = m.convo_id "
+                    "WHERE c.id = ? AND c.username = ? ORDER BY m.seq", (convo_id, username)).fetchall()
+            # Rows written before messages were stored as BLOBs come back as str.
+            history = [row[0] if isinstance(row[0], bytes) else row[0].encode('utf-8') for row in rows]
+        finally:
+            # The race check and the cache fill share one critical section, so no write can slip in between them.
+            with self._history_cache_lock:
+                fill[0] -= 1
+                raced = fill[1] != writes_before
+                if not fill[0]:
+                    del self._history_fills[key]
+                # An empty result may be someone else's (or no) conversation, so only found ones are cached; a write
+                # that landed mid-read may or may not be in the rows, so that result is left for the next read to cache.
+                if history and not raced and key not in self._history_cache:
+                    self._cache_history(key, list(history))
+        return history
+    def _cache_history(self, key: tuple, history: List[bytes]):
+        if not self._history_cache_size:
+            return
+        self._history_cache[key] = history
+        if len(self._history_cache) > self._history_cache_size:
+            self._history_cache.popitem(last=False)
     def get_all_conversations_for_user(self, username: str) -> List[Dict]:
-        return [{"id": c["id"], "title": c["title"]} for c in self.user_conversations[username]]
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, title FROM conversations WHERE username = ? ORDER BY rowid DESC", (username,)).fetchall()
+        return [{"id": row[0], "title": row[1]} for row in rows]
+
+class SemanticAnswerCache:
+    """LRU answer cache for first-turn questions, hit only on a near-duplicate query with near-identical retrieved evidence."""
+    def __init__(self, max_entries: int = 512, similarity_threshold: float = 0.95, evidence_threshold: float = 0.8, path: str = None):
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.evidence_threshold = evidence_threshold
+        self.path = path
+        self._lock = threading.Lock()
+        self._embeddings = None  # float16 query embeddings, allocated on first store; row i belongs to _entries[i].
+        self._entries = []  # (scope, evidence_ids, answer)
+        self._recency = OrderedDict()  # slot -> None, least recently used first.
+        self._load()
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'rb') as f:
+                state = pickle.load(f)
+            self._embeddings, self._entries = state['embeddings'], state['entries']
+            self._recency = OrderedDict.fromkeys(state['recency'])
+            logger.info(f"Loaded {len(self._entries)} cached answers from {self.path}.")
+        except Exception as e:
+            logger.error(f"Failed to load answer cache: {e}")
+    def save(self):
+        if not self.path or not self._entries:
+            return
+        try:
+            with self._lock:
+                state = {'embeddings': self._embeddings.copy(), 'entries': list(self._entries), 'recency': list(self._recency)}
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            if not MULTI_WORKER:
+                self._write(state)
+                return
+            # Every worker saves at exit; each folds in what the others already wrote instead of overwriting it.
+            with open(self.path + '.lock', 'w') as lock:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                self._write(self._merge_saved(state))
+        except Exception as e:
+            logger.error(f"Failed to save answer cache: {e}")
+    def _write(self, state: Dict):
+        # Written aside and renamed over, so a crash mid-dump never leaves a truncated cache for the next start.
+        with open(self.path + '.tmp', 'wb') as f:
+            pickle.dump(state, f)
+        os.replace(self.path + '.tmp', self.path)
+    def _merge_saved(self, state: Dict) -> Dict:
+        """The given state plus entries only found in the saved file, ours counted as more recent when over capacity."""
+        try:
+            with open(self.path, 'rb') as f:
+                saved = pickle.load(f)
+        except Exception:
+            return state
+        ours = set(state['entries'])
+        rows = [(saved['entries'][slot], saved['embeddings'][slot]) for slot in saved['recency'] if saved['entries'][slot] not in ours]
+        rows += [(state['entries'][slot], state['embeddings'][slot]) for slot in state['recency']]
+        rows = rows[-self.max_entries:]
+        embeddings = np.empty((self.max_entries, state['embeddings'].shape[1]), dtype=np.float16)
+        for slot, (_, embedding) in enumerate(rows):
+            embeddings[slot] = embedding
+        return {'embeddings': embeddings, 'entries': [entry for entry, _ in rows], 'recency': list(range(len(rows)))}
+    def lookup(self, scope: str, query_embedding: np.ndarray, evidence_ids: tuple):
+        with self._lock:
+            if not self._entries:
+                return None
+            similarities = np.dot(self._embeddings[:len(self._entries)], query_embedding.astype(np.float16)).astype(np.float32)
+            evidence = frozenset(evidence_ids)
+            for slot in np.argsort(similarities)[::-1]:
+                if similarities[slot] < self.similarity_threshold:
+                    break
+                entry_scope, entry_evidence, answer = self._entries[slot]
+                if entry_scope == scope and self._jaccard(entry_evidence, evidence) >= self.evidence_threshold:
+                    self._recency.move_to_end(int(slot))
+                    return answer
+        return None
+    def store(self, scope: str, query_embedding: np.ndarray, evidence_ids: tuple, answer: str):
+        with self._lock:
+            if self._embeddings is None:
+                self._embeddings = np.empty((self.max_entries, query_embedding.shape[0]), dtype=np.float16)
+            entry = (scope, frozenset(evidence_ids), answer)
+            if len(self._entries) < self.max_entries:
+                slot = len(self._entries)
+                self._entries.append(entry)
+            else:
+                slot, _ = self._recency.popitem(last=False)
+                self._entries[slot] = entry
+            self._embeddings[slot] = query_embedding
+            self._recency[slot] = None
+    @staticmethod
+    def _jaccard(a: frozenset, b: frozenset) -> float:
+        if not a and not b:
+            return 1.0
+        return len(a & b) / len(a | b)
+
+class RetrievalBatcher:
+    """Coalesces concurrent knowledge searches into one batched encode and index scan.
+
+    Questions arriving while a batch is in flight are queued and searched together as soon as it finishes,
+    so a lone request never waits on a timer and concurrent ones share a single model forward.
+    """
+    def __init__(self, search_batch, max_batch_size: int = 32):
+        self._search_batch = search_batch
+        self._max_batch_size = max_batch_size
+        self._pending = []
+        self._worker = None
+
+    async def search(self, question: str) -> tuple:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((question, future))
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._drain())
+        return await future
+
+    async def _drain(self):
+        try:
+            while self._pending:
+                batch = self._pending[:self._max_batch_size]
+                del self._pending[:self._max_batch_size]
+                try:
+                    results = await asyncio.to_thread(self._search_batch, [question for question, _ in batch])
+                except Exception as e:
+                    results = [e] * len(batch)
+                for (_, future), result in zip(batch, results):
+                    if future.done():  # The caller went away (e.g. the client disconnected).
+                        continue
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+        finally:
+            self._worker = None
 
 class iTethrBot:
     def __init__(self):
@@ -113,23 +456,121 @@ class iTethrBot:
 
         self.groq_client = GroqClient(api_key=groq_api_key)
         self.memory = ConversationMemory()
-        self.embeddings_model = None
+        self._embeddings_model = None
+        self._embeddings_model_lock = threading.Lock()
+        self._embeddings_model_error = None  # Set when the encoder can never match the loaded vectors; not retried.
+        # Decided before any cache is read, since cached vectors are only valid for the encoder variant that made them.
+        self._embeddings_backend = self._configured_embeddings_backend()
+        self._onnx_file = os.getenv("EMBEDDINGS_ONNX_FILE") or _default_onnx_file()
         self.documents = []
         self.embeddings = []
+        self.index = None
+        self._query_cache = OrderedDict()
+        self._query_cache_size = 2048
+        self._query_cache_lock = threading.Lock()
+        # Dedented so the source indentation isn't sent as prompt tokens with every request.
+        self._system_preamble = textwrap.dedent(f"""
+            You are iBot, an extremely fast, accurate, and helpful AI assistant for the iTethr team, Powered by AeonovX.
+            Your version is {self.version}. You are an expert on the iTethr platform.
+
+            **Your Primary Directive:**
+            1.  **Use Documentation First:** Your primary source of information is the `DOCUMENTATION CONTEXT` provided below. Base your answers on this context whenever possible.
+            2.  **Be Accurate:** When citing the documentation, be precise. Do not make assumptions beyond what is written.
+            3.  **Admit Ignorance:** If the documentation does not contain the answer, clearly state that the information is not in your documents and then try to answer using your general knowledge.
+            4.  **Use Tools:** If you need the current time or date, you MUST use the `get_current_time` tool. Do not guess.
+            5.  **Formatting:** Use Markdown for clear, readable formatting (e.g., lists, bolding, code blocks).
+            """).strip()
+        self._system_preamble_message = orjson.dumps({"role": "system", "content": self._system_preamble})
+        self._context_header = "\n\n---\nDOCUMENTATION CONTEXT:\n"
+        self._context_footer = "\n---\n"
+        self._context_for = lru_cache(maxsize=256)(self._materialize_context)
+        self._session_message_for = lru_cache(maxsize=256)(self._render_session_message)
+        self._retrieval_batcher = RetrievalBatcher(self._search_chunk_ids_batch)
+        # The tool schema is static, so it is serialized once rather than on every model call.
+        self.tools_json = orjson.dumps([tools.get_tools_config()])
         self._setup_bot()
+        # Cached answers cite chunk ids, so the persisted cache is only valid for the corpus it was built on.
+        self.answer_cache = SemanticAnswerCache(path=os.path.join('./data', f"answers_{self._corpus_digest()}.pkl"))
+        atexit.register(self.answer_cache.save)
         logger.info(f"🚀 {self.version} logic core initialized with tools.")
 
     def authenticate(self, name: str, password: str) -> Dict:
         """Authenticates a user against the team database."""
-        user_data = AEONOVX_TEAM.get(name)
-        if user_data and user_data.get("password") == password:
-            return {"username": name, "role": user_data.get("role")}
+        member = find_team_member(name)
+        # Conversations are keyed by the stored spelling, so "sharjan" and "Sharjan" share one history.
+        stored_name, user_data = member if member is not None else (None, {})
+        # Comparing fixed-length digests in constant time leaks neither the password's content nor its length.
+        # Unknown names go through the same hash and compare, so response time does not reveal which names exist.
+        password_matches = hmac.compare_digest(hashlib.sha256(password.encode('utf-8')).digest(),
+                                               _password_digest(user_data.get("password", "")))
+        if member is not None and password_matches:
+            return {"username": stored_name, "role": user_data.get("role")}
         return None
 
+    @property
+    def embeddings_model(self) -> SentenceTransformer:
+        """The encoder, loaded on first use so a fully cached corpus does not wait for it at startup."""
+        if self._embeddings_model is None:
+            with self._embeddings_model_lock:
+                if self._embeddings_model is None:
+                    if self._embeddings_model_error is not None:
+                        raise self._embeddings_model_error
+                    self._embeddings_model = self._load_embeddings_model()
+        return self._embeddings_model
+
+    @staticmethod
+    def _configured_embeddings_backend() -> str:
+        if torch.cuda.is_available():
+            return "cuda"
+        if os.getenv("EMBEDDINGS_BACKEND", "onnx") == "onnx" and all(
+                importlib.util.find_spec(module) for module in ("onnxruntime", "optimum")):
+            return "onnx"
+        return "torch"
+
+    def _embeddings_variant(self) -> str:
+        """Names the encoder producing vectors, e.g. "onnx-model_quint8_avx2"; quantized exports give different vectors."""
+        if self._embeddings_backend == "onnx":
+            return f"onnx-{os.path.splitext(os.path.basename(self._onnx_file))[0]}"
+        return self._embeddings_backend
+
+    def _load_embeddings_model(self) -> SentenceTransformer:
+        """Loads MiniLM in FP16 on a GPU when one is present, else on ONNX Runtime (int8), else eager PyTorch."""
+        if self._embeddings_backend == "cuda":
+            model = SentenceTransformer(EMBEDDINGS_MODEL_NAME, device="cuda", model_kwargs=TORCH_MODEL_KWARGS)
+            model.half()
+            logger.info("Running embeddings on CUDA in FP16.")
+            return model
+        # A few threads saturate a 384-dim encoder; more only contend with the server's own I/O threads.
+        num_threads = int(os.getenv("EMBEDDINGS_THREADS", min(4, os.cpu_count() or 1)))
+        torch.set_num_threads(num_threads)
+        if self._embeddings_backend == "onnx":
+            try:
+                import onnxruntime
+                # ONNX Runtime keeps its own thread pools, which torch.set_num_threads/set_num_interop_threads don't reach.
+                session_options = onnxruntime.SessionOptions()
+                session_options.intra_op_num_threads = num_threads
+                session_options.inter_op_num_threads = 1
+                session_options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+                return SentenceTransformer(EMBEDDINGS_MODEL_NAME, backend="onnx",
+                                           model_kwargs={"file_name": self._onnx_file, "session_options": session_options})
+            except Exception as e:
+                if len(self.embeddings):
+                    # The documents were already served from vectors cached for this ONNX export; PyTorch query
+                    # vectors would be scored against them with silently skewed similarities.
+                    self._embeddings_model_error = RuntimeError(
+                        f"ONNX embeddings backend failed to load ({e}) while documents use {self._embeddings_variant()} "
+                        "vectors; set EMBEDDINGS_BACKEND=torch to re-embed them, or fix the ONNX install.")
+                    logger.error(str(self._embeddings_model_error))
+                    raise self._embeddings_model_error from e
+                logger.warning(f"ONNX embeddings backend unavailable, falling back to PyTorch: {e}")
+                self._embeddings_backend = "torch"
+        return SentenceTransformer(EMBEDDINGS_MODEL_NAME, device="cpu", model_kwargs=TORCH_MODEL_KWARGS)
+
     def _setup_bot(self):
         try:
-            self.embeddings_model = SentenceTransformer('all-MiniLM-L6-v2')
             self._load_all_documents()
+            # Warm the encoder off the startup path so the first question does not pay for loading it.
+            threading.Thread(target=lambda: self.embeddings_model, name="embeddings-warmup", daemon=True).start()
         except Exception as e:
             logger.error(f"Fatal error during bot setup: {e}", exc_info=True)
             raise
@@ -140,117 +581,317 @@ class iTethrBot:
             logger.warning(f"Documents directory not found: {doc_path}")
             return
 
-        for filename in os.listdir(doc_path):
-            if filename.endswith(".txt"):
-                try:
-                    with open(os.path.join(doc_path, filename), 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        chunks = self._create_chunks(content)
-                        self.documents.extend(chunks)
-                        logger.info(f"Loaded and chunked document: {filename}")
-                except Exception as e:
-                    logger.error(f"Failed to read or chunk document {filename}: {e}")
+        filenames = [os.path.join(doc_path, f) for f in sorted(os.listdir(doc_path)) if f.endswith(".txt")]
+        # Reads overlap on a thread pool; results come back in filename order so chunk order stays deterministic.
+        with ThreadPoolExecutor(max_workers=min(8, len(filenames) or 1)) as executor:
+            for chunks in executor.map(self._read_and_chunk, filenames):
+                self.documents.extend(chunks)
+
+        # Boilerplate repeated across files would otherwise be embedded, and retrieved, more than once.
+        unique_documents = list(dict.fromkeys(self.documents))
+        if len(unique_documents) < len(self.documents):
+            logger.info(f"Dropped {len(self.documents) - len(unique_documents)} duplicate chunks.")
+            self.documents = unique_documents
 
         if self.documents:
             try:
-                self.embeddings = self.embeddings_model.encode(self.documents, show_progress_bar=True)
-                logger.info(f"Created {len(self.embeddings)} embeddings for the knowledge base.")
+                self.embeddings = self._embed_documents()
+                self.index = self._build_index()
             except Exception as e:
                 logger.error(f"Failed to create embeddings: {e}")
 
+    def _read_and_chunk(self, path: str) -> List[str]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                chunks = self._create_chunks(f.read())
+            logger.info(f"Loaded and chunked document: {os.path.basename(path)}")
+            return chunks
+        except Exception as e:
+            logger.error(f"Failed to read or chunk document {os.path.basename(path)}: {e}")
+            return []
+
+    def _corpus_digest(self) -> str:
+        """Hash of the model name, encoder variant and every chunk, so any edit to the corpus or encoder changes it."""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(EMBEDDINGS_MODEL_NAME.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(self._embeddings_variant().encode('utf-8'))
+        for chunk in self.documents:
+            digest.update(b'\0')
+            digest.update(chunk.encode('utf-8'))
+        return digest.hexdigest()
+
+    def _embeddings_cache_paths(self) -> tuple:
+        prefix = os.path.join('./data', f"embeddings_{EMBEDDINGS_MODEL_NAME.replace('/', '_')}_{self._embeddings_variant()}")
+        return f"{prefix}_keys.npy", f"{prefix}_vectors.npy"
+
+    def _embed_documents(self) -> np.ndarray:
+        """Embeds self.documents, encoding only chunks whose sha256 is missing from the on-disk cache."""
+        keys = np.array([hashlib.sha256(chunk.encode('utf-8')).digest() for chunk in self.documents], dtype='S32')
+        variant = self._embeddings_variant()
+        keys_path, vectors_path = self._embeddings_cache_paths()
+        cached_keys, cached_vectors = None, None
+        if os.path.exists(keys_path) and os.path.exists(vectors_path):
+            try:
+                cached_keys = np.load(keys_path)
+                cached_vectors = np.load(vectors_path, mmap_mode='r')
+            except Exception as e:
+                logger.error(f"Failed to load embeddings cache: {e}")
+                cached_keys, cached_vectors = None, None
+        if cached_keys is not None and np.array_equal(cached_keys, keys):
+            logger.info(f"Loaded {len(cached_vectors)} cached embeddings from {vectors_path}.")
+            return cached_vectors
+
+        dimension = self.embeddings_model.get_sentence_embedding_dimension()
+        if self._embeddings_variant() != variant:
+            # The configured encoder failed to load, so vectors cached for it can't be mixed with the fallback's.
+            cached_keys = None
+        cached_rows = {} if cached_keys is None else {key: row for row, key in enumerate(cached_keys.tolist())}
+        hits = [(i, cached_rows[key]) for i, key in enumerate(keys.tolist()) if key in cached_rows]
+        missing = [i for i, key in enumerate(keys.tolist()) if key not in cached_rows]
+        # Half precision halves the memory streamed by every search.
+        embeddings = np.empty((len(self.documents), dimension), dtype=np.float16)
+        if hits:
+            targets, sources = map(list, zip(*hits))
+            embeddings[targets] = cached_vectors[sources]
+        if missing:
+            # Normalize once at load time so cosine similarity becomes a plain dot product.
+            # All new chunks from every file go through a single encode() call so batching and padding are shared;
+            # encode() length-sorts its inputs internally, so each mini-batch is already padded uniformly.
+            embeddings[missing] = self.embeddings_model.encode(
+                [self.documents[i] for i in missing], batch_size=64, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False
+            )
+        logger.info(f"Created {len(missing)} embeddings and reused {len(hits)} cached ones for the knowledge base.")
+        self._save_embeddings_cache(keys, embeddings)
+        return embeddings
+
+    def _save_embeddings_cache(self, keys: np.ndarray, embeddings: np.ndarray):
+        try:
+            os.makedirs('./data', exist_ok=True)
+            # Write beside the old files and swap them in, since the old vectors may still be memory-mapped.
+            # The temp name is per process so workers saving at the same time never interleave into one file.
+            for path, array in zip(self._embeddings_cache_paths(), (keys, embeddings)):
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    np.save(f, array)
+                os.replace(tmp_path, path)
+        except Exception as e:
+            logger.error(f"Failed to save embeddings cache: {e}")
+
     def _create_chunks(self, content: str, chunk_size=400, overlap=50) -> List[str]:
         if not content: return []
         words = content.split()
         if not words: return []
-        return [' '.join(words[i:i + chunk_size]) for i in range(0, len(words), chunk_size - overlap)]
-
-    def _search_knowledge(self, question: str, top_k=3) -> str:
+        # Join once and slice by precomputed word offsets instead of re-joining every overlapping window.
+        text = ' '.join(words)
+        offsets = [0, *accumulate(len(w) + 1 for w in words)]
+        n = len(words)
+        return [text[offsets[i]:offsets[min(i + chunk_size, n)] - 1] for i in range(0, n, chunk_size - overlap)]
+
+    def _build_index(self):
+        """Builds (or reloads) a FAISS inner-product index over the normalized embeddings, if faiss is installed."""
+        if faiss is None:
+            return None
+        index_path = os.path.join('./data', f"index_{self._corpus_digest()}.faiss")
+        if os.path.exists(index_path):
+            try:
+                # Map the stored codes in place (faiss >= 1.10) so pages fault in on demand and are shared via the page cache.
+                index = faiss.read_index(index_path, getattr(faiss, "IO_FLAG_MMAP_IFC", 0))
+                logger.info(f"Loaded FAISS index with {index.ntotal} vectors from {index_path}.")
+                return index
+            except Exception as e:
+                logger.error(f"Failed to load FAISS index: {e}")
+        vectors = np.ascontiguousarray(self.embeddings, dtype=np.float32)
+        # 8-bit scalar quantization (per-dimension range) stores one byte per component, a quarter of float32.
+        if len(vectors) >= HNSW_MIN_VECTORS:
+            index = faiss.IndexHNSWSQ(vectors.shape[1], faiss.ScalarQuantizer.QT_8bit, 32, faiss.METRIC_INNER_PRODUCT)
+        else:
+            # Below this size an exhaustive scan is both exact and faster than walking a graph.
+            index = faiss.IndexScalarQuantizer(vectors.shape[1], faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+        index.add(vectors)
+        logger.info(f"Built {type(index).__name__} with {index.ntotal} vectors.")
+        try:
+            os.makedirs('./data', exist_ok=True)
+            # Another worker may have the current file memory-mapped, so it is replaced by rename, never rewritten.
+            tmp_path = f"{index_path}.{os.getpid()}.tmp"
+            faiss.write_index(index, tmp_path)
+            os.replace(tmp_path, index_path)
+        except Exception as e:
+            logger.error(f"Failed to save FAISS index: {e}")
+        return index
+
+    def _encode_queries(self, questions: List[str]) -> np.ndarray:
+        """Returns normalized embeddings for the questions, encoding all cache misses in a single batch."""
+        # MiniLM's tokenizer is uncased and whitespace-insensitive, so folding both only widens cache hits.
+        keys = [" ".join(question.lower().split()) for question in questions]
+        found = {}
+        with self._query_cache_lock:
+            for key in keys:
+                embedding = self._query_cache.get(key)
+                if embedding is not None:
+                    self._query_cache.move_to_end(key)
+                    found[key] = embedding
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if missing:
+            encoded = self.embeddings_model.encode(missing, normalize_embeddings=True).astype(np.float32)
+            with self._query_cache_lock:
+                for key, embedding in zip(missing, encoded):
+                    found[key] = embedding
+                    self._query_cache[key] = embedding
+                while len(self._query_cache) > self._query_cache_size:
+                    self._query_cache.popitem(last=False)
+        return np.stack([found[key] for key in keys])
+
+    def _encode_query(self, question: str) -> np.ndarray:
+        """Returns the normalized query embedding, reusing it for repeated questions."""
+        return self._encode_queries([question])[0]
+
+    def _retrieve_batch(self, questions: List[str], top_k=3) -> List[tuple]:
+        """For each question, the indices of the top_k chunks scoring above the relevance threshold, best first."""
+        question_embeddings = self._encode_queries(questions)
+        if self.index is not None:
+            scores, indices = self.index.search(question_embeddings, top_k)
+            return [tuple(int(idx) for idx, score in zip(row_indices, row_scores) if idx >= 0 and score > 0.3)
+                    for row_indices, row_scores in zip(indices, scores)]
+        similarities = self._score_all(question_embeddings)
+        k = min(top_k, similarities.shape[1])
+        results = []
+        for row, candidates in zip(similarities, np.argpartition(similarities, -k, axis=1)[:, -k:]):
+            top_indices = candidates[np.argsort(row[candidates])[::-1]]
+            results.append(tuple(int(idx) for idx in top_indices if row[idx] > 0.3))
+        return results
+
+    def _score_all(self, question_embeddings: np.ndarray, block_rows: int = 2048) -> np.ndarray:
+        """(B x N) similarities of the queries against the float16 corpus matrix.
+
+        numpy has no BLAS kernel for float16, so its matmul falls back to a scalar loop that is about 10x slower.
+        Upcasting one cache-sized block of rows at a time keeps the float16 storage while every product runs as an SGEMM.
+        """
+        similarities = np.empty((len(self.embeddings), len(question_embeddings)), dtype=np.float32)
+        for start in range(0, len(self.embeddings), block_rows):
+            block = self.embeddings[start:start + block_rows].astype(np.float32)
+            np.dot(block, question_embeddings.T, out=similarities[start:start + block_rows])
+        return similarities.T
+
+    def _materialize_context(self, chunk_ids: tuple) -> str:
+        return "\n\n---\n\n".join(self.documents[idx] for idx in chunk_ids)
+
+    def _render_session_message(self, name: str, role: str, chunk_ids: tuple) -> bytes:
+        """The serialized per-user system message carrying the retrieved documentation."""
+        context = self._context_for(chunk_ids)
+        session_prompt = "".join((
+            f"You are currently speaking to {name}, whose role is {role}. Be respectful and professional.",
+            self._context_header,
+            context if context else "No relevant documentation was found for this query.",
+            self._context_footer,
+        ))
+        return orjson.dumps({"role": "system", "content": session_prompt})
+
+    def _search_chunk_ids_batch(self, questions: List[str], top_k=3) -> List[tuple]:
         if len(self.documents) == 0 or self.embeddings is None or len(self.embeddings) == 0:
-            return ""
+            return [()] * len(questions)
         try:
-            question_embedding = self.embeddings_model.encode([question])
-            similarities = cosine_similarity(question_embedding, self.embeddings)[0]
-            top_indices = np.argsort(similarities)[-top_k:][::-1]
-            relevant_docs = [self.documents[idx] for idx in top_indices if similarities[idx] > 0.3]
-            return "\n\n---\n\n".join(relevant_docs)
+            return self._retrieve_batch(questions, top_k)
         except Exception as e:
             logger.error(f"Error during knowledge search: {e}")
-            return ""
+            return [()] * len(questions)
 
-    def get_response_stream(self, message: str, username: str, user_info: Dict, convo_id: str = None) -> Generator[str, None, None]:
+    async def get_response_stream(self, message: str, username: str, user_info: Dict, convo_id: str = None) -> AsyncGenerator[bytes, None]:
         try:
             if not convo_id:
                 convo_id = self.memory.start_new_conversation(username, message)
 
-            self.memory.add_message_to_conversation(username, convo_id, {"role": "user", "content": message})
-
-            context = self._search_knowledge(message)
-
-            system_prompt = f"""
-            You are iBot, an extremely fast, accurate, and helpful AI assistant for the iTethr team, Powered by AeonovX.
-            Your version is {self.version}. You are an expert on the iTethr platform.
-
-            You are currently speaking to {user_info.get('name', 'a team member')}, whose role is {user_info.get('role', 'Developer')}. Be respectful and professional.
-
-            **Your Primary Directive:**
-            1.  **Use Documentation First:** Your primary source of information is the `DOCUMENTATION CONTEXT` provided below. Base your answers on this context whenever possible.
-            2.  **Be Accurate:** When citing the documentation, be precise. Do not make assumptions beyond what is written.
-            3.  **Admit Ignorance:** If the documentation does not contain the answer, clearly state that the information is not in your documents and then try to answer using your general knowledge.
-            4.  **Use Tools:** If you need the current time or date, you MUST use the `get_current_time` tool. Do not guess.
-            5.  **Formatting:** Use Markdown for clear, readable formatting (e.g., lists, bolding, code blocks).
+            # Only the token text changes between stream events, so the envelope is serialized once.
+            chunk_prefix = b'{"type":"chunk","convo_id":' + orjson.dumps(convo_id) + b',"content":'
+            end_event = orjson.dumps({"type": "end", "convo_id": convo_id}) + b"\n"
 
-            ---
-            DOCUMENTATION CONTEXT:
-            {context if context else "No relevant documentation was found for this query."}
-            ---
-            """
+            self.memory.add_message_to_conversation(username, convo_id, {"role": "user", "content": message})
 
-            api_history = [{"role": "system", "content": system_prompt}]
-            api_history.extend(self.memory.get_conversation_history(username, convo_id))
+            # Retrieval (model inference) and history reads (SQLite) block, so they run off the event loop.
+            # Small talk skips the encoder forward pass entirely; there is nothing in the docs to find.
+            needs_retrieval = SMALL_TALK_PATTERN.fullmatch(message.strip()) is None
+            chunk_ids = await self._retrieval_batcher.search(message) if needs_retrieval else ()
+            conversation_history = await asyncio.to_thread(self.memory.get_serialized_history, username, convo_id)
 
-            tools_config_list = [tools.get_tools_config()]
+            # Only opening questions are cacheable; later turns depend on the conversation so far.
+            query_embedding = None
+            if len(conversation_history) == 1 and needs_retrieval:
+                try:
+                    query_embedding = await asyncio.to_thread(self._encode_query, message)
+                except Exception as e:
+                    # The cache is an optimization; without an embedding the question is simply answered uncached.
+                    logger.error(f"Error encoding query for the answer cache: {e}")
+                cached_answer = None
+                if query_embedding is not None:
+                    # The similarity scan grows with the cache, so like the corpus scan it stays off the event loop.
+                    cached_answer = await asyncio.to_thread(self.answer_cache.lookup, username, query_embedding, chunk_ids)
+                if cached_answer is not None:
+                    self.memory.add_message_to_conversation(username, convo_id, {"role": "assistant", "content": cached_answer})
+                    yield chunk_prefix + orjson.dumps(cached_answer) + b"}\n"
+                    yield end_event
+                    return
+
+            name, role = user_info.get('name', 'a team member'), user_info.get('role', 'Developer')
+            # user_info is arbitrary client JSON; only plain strings are hashable cache keys, anything else renders uncached.
+            render = self._session_message_for if isinstance(name, str) and isinstance(role, str) else self._render_session_message
+            session_message = render(name, role, chunk_ids)
+
+            # The static preamble is byte-identical on every request so the provider's prefix cache can reuse it.
+            api_history = [self._system_preamble_message, session_message]
+            api_history.extend(conversation_history)
 
             while True:
-                full_bot_response = ""
-                tool_calls_to_process = []
+                response_parts = []
+                # Tool calls may arrive split across deltas; fragments are merged by their index before anything runs.
+                tool_calls_by_index = {}
 
-                for result in self.groq_client.generate_response_stream(api_history, tools_config_list):
+                async for result in self.groq_client.generate_response_stream(api_history, self.tools_json):
                     if result["type"] == "chunk":
-                        full_bot_response += result["content"]
-                        yield json.dumps({"type": "chunk", "content": result["content"], "convo_id": convo_id}) + "\n"
+                        response_parts.append(result["content"])
+                        yield chunk_prefix + orjson.dumps(result["content"]) + b"}\n"
                     elif result["type"] == "tool_call":
-                        tool_calls_to_process.append(result['call'])
+                        call = result["call"]
+                        slot = tool_calls_by_index.setdefault(call.get("index", len(tool_calls_by_index)), {
+                            "id": "", "type": "function", "function": {"name": "", "arguments": ""}})
+                        slot["id"] += call.get("id") or ""
+                        function = call.get("function") or {}
+                        slot["function"]["name"] += function.get("name") or ""
+                        slot["function"]["arguments"] += function.get("arguments") or ""
                     elif result["type"] == "error":
-                        yield json.dumps(result) + "\n"
+                        yield orjson.dumps(result) + b"\n"
                         return
 
+                tool_calls_to_process = [tool_calls_by_index[index] for index in sorted(tool_calls_by_index)]
                 if tool_calls_to_process:
+                    # Tool results (e.g. the current time) go stale, so these answers are never cached.
+                    query_embedding = None
                     assistant_message = {"role": "assistant", "content": None, "tool_calls": tool_calls_to_process}
                     # [FIX] Corrected the typo below from add__message... to add_message...
-                    self.memory.add_message_to_conversation(username, convo_id, assistant_message)
-                    api_history.append(assistant_message)
-
-                    for tool_call in tool_calls_to_process:
-                        tool_name = tool_call['function']['name']
-                        tool_args_str = tool_call['function']['arguments']
-                        tool_call_id = tool_call['id']
+                    api_history.append(self.memory.add_message_to_conversation(username, convo_id, assistant_message))
 
-                        tool_output = tools.execute_tool(name=tool_name, args=tool_args_str)
+                    # Tools are blocking and mostly I/O-bound, so every call in the turn runs concurrently off the event loop.
+                    tool_outputs = await asyncio.gather(*(
+                        asyncio.to_thread(tools.execute_tool, name=tool_call['function']['name'], args=tool_call['function']['arguments'])
+                        for tool_call in tool_calls_to_process))
 
+                    for tool_call, tool_output in zip(tool_calls_to_process, tool_outputs):
                         tool_result_message = {
                             "role": "tool",
-                            "tool_call_id": tool_call_id,
-                            "content": json.dumps({"result": tool_output})
+                            "tool_call_id": tool_call['id'],
+                            "content": orjson.dumps({"result": tool_output}).decode('utf-8')
                         }
-                        self.memory.add_message_to_conversation(username, convo_id, tool_result_message)
-                        api_history.append(tool_result_message)
+                        api_history.append(self.memory.add_message_to_conversation(username, convo_id, tool_result_message))
 
                     continue
                 else:
+                    full_bot_response = "".join(response_parts)
                     self.memory.add_message_to_conversation(username, convo_id, {"role": "assistant", "content": full_bot_response})
-                    yield json.dumps({"type": "end", "convo_id": convo_id}) + "\n"
+                    if query_embedding is not None and full_bot_response:
+                        self.answer_cache.store(username, query_embedding, chunk_ids, full_bot_response)
+                    yield end_event
                     break
 
         except Exception as e:
             logger.error(f"Critical error in get_response_stream: {e}", exc_info=True)
-            yield json.dumps({"type": "error", "content": "A critical server error occurred."}) + "\n"
\ No newline at end of file
+            yield orjson.dumps({"type": "error", "content": "A critical server error occurred."}) + b"\n"
\ No newline at end of file
@@ -2,20 +2,32 @@
 
 import uvicorn
 import os
+import asyncio
+import atexit
 import logging
-from fastapi import FastAPI, Request, HTTPException
+import mimetypes
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from fastapi import FastAPI, HTTPException
 from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from pydantic import BaseModel
-import asyncio
+from pydantic import BaseModel, ConfigDict, Field
 from fastapi.middleware.cors import CORSMiddleware
 
 # Assuming your iTethrBot class is in 'bot.py'
 from bot import iTethrBot
 
 # --- Basic Setup ---
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Request handlers only enqueue log records; a listener thread formats them and writes to the console.
+log_queue = queue.SimpleQueue()
+console_handler = logging.StreamHandler()
+console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+log_listener = QueueListener(log_queue, console_handler)
+log_listener.start()
+atexit.register(log_listener.stop)
+# force=True replaces the console handler bot.py installs when it is imported. The queue handler only merges
+# arguments into the message; the listener's handler applies the full format off the request path.
+logging.basicConfig(level=logging.INFO, format='%(message)s', handlers=[QueueHandler(log_queue)], force=True)
 logger = logging.getLogger("main")
 
 # --- FastAPI App Initialization ---
@@ -26,57 +38,158 @@ app = FastAPI(
 )
 
 # --- Add CORS Middleware ---
-origins = ["*"]
+# The bundled web UI is same-origin, so no cross-origin frontend is admitted unless CORS_ORIGINS (comma-separated) names it.
+# Credentials are never allowed alongside the "*" wildcard.
+origins = [origin.strip() for origin in os.environ.get("CORS_ORIGINS", "").split(",") if origin.strip()]
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_credentials="*" not in origins,
+    allow_methods=["GET", "POST"],
+    allow_headers=["Content-Type", "Authorization"],
+    max_age=86400,  # Browsers reuse a preflight for a day instead of repeating it before every API call.
 )
 
 # --- Mount Static Files ---
-app.mount("/static", StaticFiles(directory="web_ui"), name="static")
-
-# --- Template Engine Setup ---
-templates = Jinja2Templates(directory="web_ui")
+def accepts_gzip(accept_encoding: bytes) -> bool:
+    """Whether an Accept-Encoding header admits gzip, honouring q=0 and the "*" wildcard (an explicit gzip wins)."""
+    qualities = {}
+    for token in accept_encoding.decode("latin-1").lower().split(","):
+        coding, *params = [part.strip() for part in token.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
+class PrecompressedStaticFiles(StaticFiles):
+    """Serves the pre-gzipped sibling of a file (built into the Docker image) to clients that accept gzip."""
+    async def get_response(self, path: str, scope):
+        accept_encoding = dict(scope["headers"]).get(b"accept-encoding", b"")
+        if accepts_gzip(accept_encoding) and scope["method"] in ("GET", "HEAD"):
+            full_path, stat_result = self.lookup_path(path + ".gz")
+            if stat_result is not None:
+                response = self.file_response(full_path, stat_result, scope)
+                media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+                response.headers["content-type"] = media_type + "; charset=utf-8" if media_type.startswith("text/") else media_type
+                response.headers["content-encoding"] = "gzip"
+                response.headers["vary"] = "Accept-Encoding"
+                return response
+        return await super().get_response(path, scope)
+
+app.mount("/static", PrecompressedStaticFiles(directory="web_ui"), name="static")
 
 # --- Data Models ---
 class AuthRequest(BaseModel):
     name: str
     password: str
 
+class AuthResponse(BaseModel):
+    status: str
+    username: str
+    role: str
+
 class ChatRequest(BaseModel):
+    # Unknown fields are dropped rather than kept on the model; surrounding whitespace never reaches the bot.
+    model_config = ConfigDict(extra="ignore", str_strip_whitespace=True)
+
     message: str
     username: str
     # [CRITICAL FIX] Corrected type hint to allow convo_id to be a string OR None.
     convo_id: str | None = None
-    user_info: dict = {}
+    user_info: dict = Field(default_factory=dict)
 
 # --- Bot Initialization ---
-try:
-    bot = iTethrBot()
-    logger.info("✅ iTethrBot instance created successfully.")
-except Exception as e:
-    logger.error(f"❌ Failed to initialize iTethrBot: {e}", exc_info=True)
+# With several workers, `python main.py` only supervises: each worker imports main afresh and builds its own bot, so
+# the supervisor skips loading a model, index and memory store it would never serve from.
+if __name__ == "__main__" and int(os.environ.get("WORKERS", 1)) > 1:
     bot = None
+else:
+    try:
+        bot = iTethrBot()
+        logger.info("✅ iTethrBot instance created successfully.")
+    except Exception as e:
+        logger.error(f"❌ Failed to initialize iTethrBot: {e}", exc_info=True)
+        bot = None
+
+async def coalesce_chunks(stream, max_bytes: int = 1200, max_delay: float = 0.05):
+    """Regroups a byte stream into writes of about max_bytes, holding data back at most max_delay seconds.
+
+    Token-sized events otherwise cost a socket write (and TLS record) each. The first chunk is sent at once so
+    time-to-first-token is unchanged.
+    """
+    loop = asyncio.get_running_loop()
+    buffer = bytearray()
+    next_chunk = None
+    flush_at = 0.0
+    first = True
+    try:
+        while True:
+            if next_chunk is None:
+                next_chunk = asyncio.ensure_future(stream.__anext__())
+            if buffer:
+                # Wait for more data only until the buffered bytes are due; the pending read carries over.
+                done, _ = await asyncio.wait((next_chunk,), timeout=max(0.0, flush_at - loop.time()))
+                if not done:
+                    yield bytes(buffer)
+                    buffer.clear()
+                    continue
+            try:
+                chunk = await next_chunk
+            except StopAsyncIteration:
+                break
+            finally:
+                next_chunk = None
+            if first:
+                first = False
+                yield chunk
+                continue
+            if not buffer:
+                flush_at = loop.time() + max_delay
+            buffer += chunk
+            if len(buffer) >= max_bytes:
+                yield bytes(buffer)
+                buffer.clear()
+        if buffer:
+            yield bytes(buffer)
+    finally:
+        if next_chunk is not None:
+            next_chunk.cancel()
+
+# (username, convo_id) pairs with a response still streaming; convo_id is None while a new chat is starting.
+active_streams = set()
+
+class GuardedStreamingResponse(StreamingResponse):
+    """Releases its conversation's slot in active_streams however the response ends.
+
+    The release lives in __call__ rather than in the body generator, because a client that disconnects before
+    the first chunk is pulled never starts the generator, so its finally would never run.
+    """
+    def __init__(self, content, stream_key: tuple, **kwargs):
+        super().__init__(content, **kwargs)
+        self.stream_key = stream_key
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            active_streams.discard(self.stream_key)
 
 # --- API Endpoints ---
 
-@app.get("/", summary="Serve Frontend HTML", include_in_schema=False)
-async def serve_frontend(request: Request):
-    """Serves the main index.html file that powers the web UI."""
-    return templates.TemplateResponse("index.html", {"request": request})
-
 @app.post("/api/auth", summary="Authenticate User")
-async def authenticate_user(auth_request: AuthRequest):
+async def authenticate_user(auth_request: AuthRequest) -> AuthResponse:
     """Handles user authentication."""
     if not bot:
         raise HTTPException(status_code=503, detail="Bot is not initialized.")
     user = bot.authenticate(auth_request.name, auth_request.password)
     if user:
         logger.info(f"Authentication successful for user: {user['username']}")
-        return {"status": "success", "username": user['username'], "role": user['role']}
+        return AuthResponse(status="success", username=user['username'], role=user['role'])
     else:
         logger.warning(f"Authentication failed for user: {auth_request.name}")
         raise HTTPException(status_code=401, detail="Invalid credentials")
@@ -87,25 +200,38 @@ async def chat_endpoint(chat_request: ChatRequest):
     if not bot:
         raise HTTPException(status_code=503, detail="Bot service is not available.")
 
-    try:
-        # The generator function that yields response chunks
-        async def stream_generator():
-            g = bot.get_response_stream(
-                message=chat_request.message,
-                username=chat_request.username,
-                user_info=chat_request.user_info,
-                convo_id=chat_request.convo_id
-            )
-            for chunk in g:
-                yield chunk
-                await asyncio.sleep(0.01) # Yield control to the event loop
+    # A repeated send (e.g. a double click) would pay for a second full LLM stream on the same conversation.
+    stream_key = (chat_request.username, chat_request.convo_id)
+    if stream_key in active_streams:
+        raise HTTPException(status_code=429, detail="A response is still streaming for this conversation.")
 
-        return StreamingResponse(stream_generator(), media_type="text/event-stream")
+    try:
+        # The bot's async generator yields at every awaited network read, so chunks go out as soon as they arrive.
+        stream = bot.get_response_stream(
+            message=chat_request.message,
+            username=chat_request.username,
+            user_info=chat_request.user_info,
+            convo_id=chat_request.convo_id
+        )
+        response = GuardedStreamingResponse(coalesce_chunks(stream), stream_key, media_type="text/event-stream",
+                                            # Tell reverse proxies (e.g. nginx) not to buffer the stream.
+                                            headers={"X-Accel-Buffering": "no"})
+        active_streams.add(stream_key)
+        return response
     except Exception as e:
         logger.error(f"Error creating stream generator: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to start chat stream.")
 
+# --- Frontend Page ---
+# Serves web_ui/index.html at "/" with ETag/304 handling. Mounted last so the API routes above take precedence.
+app.mount("/", PrecompressedStaticFiles(directory="web_ui", html=True), name="frontend")
+
 # --- Server Execution ---
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8080))
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    workers = int(os.environ.get("WORKERS", 1))
+    # uvloop and httptools (from uvicorn[standard]) are named explicitly so a missing one fails loudly instead of
+    # silently falling back to the pure-Python loop and parser. Extra workers each load their own model; bot.py
+    # turns off its history LRU and merges answer-cache saves when WORKERS > 1.
+    uvicorn.run("main:app" if workers > 1 else app, host="0.0.0.0", port=port,
+                loop="uvloop", http="httptools", workers=workers)
\ No newline at end of file
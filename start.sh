@@ -7,5 +7,5 @@ echo "🚀 Starting iTethr Bot FastAPI Server on Railway..."
 mkdir -p ./data ./logs
 
 # The PORT environment variable is set by Railway.
-# We run the main FastAPI app using uvicorn.
-exec uvicorn main:app --host 0.0.0.0 --port ${PORT:-8000}
+# We run the main FastAPI app using uvicorn on uvloop and httptools; WORKERS adds processes where more CPUs are allotted.
+exec uvicorn main:app --host 0.0.0.0 --port ${PORT:-8000} --loop uvloop --http httptools --workers ${WORKERS:-1}
@@ -2,7 +2,7 @@
 # Description: Manages the AeonovX team database.
 # [FIX] Corrected typo in role "AI Dveloper" to "AI Developer".
 
-# Team member database - Both name and password must match exactly
+# Team member database - Names match case-insensitively; passwords must match exactly
 AEONOVX_TEAM = {
     "Sharjan": {"password": "i1234", "role": "Financial Analyst"},
     "Naveen": {"password": "i1234", "role": "AI Developer"}, # Corrected typo
@@ -11,18 +11,31 @@ AEONOVX_TEAM = {
     "Akhiljith": {"password": "i1234", "role": "UI designer"},
 }
 
+# Lowercased name -> name as stored, so a login resolves with one dict hit whatever its capitalization
+_NAMES_BY_LOWER = {name.lower(): name for name in AEONOVX_TEAM}
+
 # --- Helper functions for team management ---
 # (All your other functions like add_team_member, list_team_members, etc., remain here)
 
+def find_team_member(name):
+    """Return (stored name, member info) for a case-insensitive name, or None"""
+    stored_name = _NAMES_BY_LOWER.get(name.lower())
+    if stored_name is None:
+        return None
+    return stored_name, AEONOVX_TEAM[stored_name]
+
 def add_team_member(name, password, role="Team Member"):
     """Add new team member to the database"""
     AEONOVX_TEAM[name] = {"password": password, "role": role}
+    _NAMES_BY_LOWER[name.lower()] = name
     print(f"✅ Added {name} ({role}) to AeonovX team")
 
 def remove_team_member(name):
     """Remove team member from the database"""
     if name in AEONOVX_TEAM:
         del AEONOVX_TEAM[name]
+        if _NAMES_BY_LOWER.get(name.lower()) == name:
+            del _NAMES_BY_LOWER[name.lower()]
         print(f"❌ Removed {name} from AeonovX team")
     else:
         print(f"⚠️ {name} not found in team database")
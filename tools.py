@@ -4,11 +4,15 @@
 
 import logging
 from datetime import datetime
+from functools import lru_cache
 import pytz
-import json
+import orjson
 
 logger = logging.getLogger(__name__)
 
+# Zone objects are immutable, so each one is built once and reused for later calls.
+_timezone = lru_cache(maxsize=64)(pytz.timezone)
+
 # --- Tool Implementations ---
 
 def get_current_time(timezone: str = "Europe/Riga") -> str:
@@ -19,7 +23,7 @@ def get_current_time(timezone: str = "Europe/Riga") -> str:
     try:
         # Use a default if the provided timezone is empty or None
         tz_str = timezone if timezone else "Europe/Riga"
-        tz = pytz.timezone(tz_str)
+        tz = _timezone(tz_str)
         current_time = datetime.now(tz)
         return f"The current time in {tz_str} is {current_time.strftime('%A, %B %d, %Y at %I:%M %p')}."
     except pytz.UnknownTimeZoneError:
@@ -74,7 +78,7 @@ def execute_tool(name: str, args: str) -> any:
         function_to_call = AVAILABLE_TOOLS[name]
         try:
             # The model provides arguments as a JSON string.
-            arguments = json.loads(args)
+            arguments = orjson.loads(args)
             return function_to_call(**arguments)
         except Exception as e:
             logger.error(f"Error executing tool '{name}' with args {args}: {e}")